@@ -1,40 +1,214 @@
 import asyncio
+import contextlib
+import importlib.util
+import json
 import os
-import platform
 import re
 import subprocess
+from itertools import islice
+from pathlib import Path
 from urllib.parse import urlparse, parse_qs
 
-import aiofiles
 import astrbot.api.message_components as Comp
 import httpx
+from async_lru import alru_cache
 from astrbot.api import logger
 from astrbot.api.event import AstrMessageEvent
 from bilibili_api import video, Credential, live, article
 from bilibili_api.opus import Opus
 from bilibili_api.video import VideoDownloadURLDataDetecter
 
-from .common import delete_boring_characters, remove_files
+from .common import delete_boring_characters, remove_files_async
 from ..constants.bili23 import *
 
-async def download_b_file(url, full_file_name, progress_callback):
+# 下载分块大小，分块越大 Python 层的循环次数越少
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# 每下载多少字节才汇报一次进度
+PROGRESS_STEP = 4 * 1024 * 1024
+
+# 缓存目录，导入时创建一次
+CACHE_DIR = Path.cwd() / "data" / "bilibili_cache"
+
+try:
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+except Exception as e:
+    logger.error(f"创建B站缓存目录失败: {e}")
+
+# 视频统计信息的展示名称与字段
+_STAT_FIELDS = (
+    ("点赞", "like"),
+    ("硬币", "coin"),
+    ("收藏", "favorite"),
+    ("分享", "share"),
+    ("总播放量", "view"),
+    ("弹幕数量", "danmaku"),
+    ("评论", "reply"),
+)
+
+# 预编译的正则
+_URL_RE = re.compile(r"(http:|https:)\/\/(space|www|live|t).bilibili.com\/[A-Za-z\d._?%&+\-=\/#]*")
+_SHORT_RE = re.compile(r"(https?://(?:b23\.tv|bili2233\.cn)/[A-Za-z\d._?%&+\-=\/#]+)")
+_BV_RE = re.compile(r'^BV[1-9a-zA-Z]{10}$', re.IGNORECASE)
+_DYN_RE = re.compile(r'[^/]+(?!.*/)')
+_ROOM_RE = re.compile(r'/(\d+)')
+_CV_RE = re.compile(r'cv(\d+)')
+_FID_RE = re.compile(r'fid=(\d+)')
+# 消息中第一个视频链接，只取链接本身，前后的文字不参与解析
+_VIDEO_URL_RE = re.compile(r'(?:https?://)?[A-Za-z\d.\-]*/video/(?:av|BV)[A-Za-z\d._?%&+\-=/#]*')
+
+# bilibili_api 内部使用标准库 json 解析接口返回，安装 orjson 后替换为更快的解析器
+try:
+    import orjson
+    from bilibili_api.utils import network as _bili_network
+except ImportError:
+    orjson = None
+
+
+class _OrjsonModule:
     """
-        下载视频文件和音频文件
+        仅替换 loads 的 json 模块代理，其余属性仍来自标准库
+    """
+
+    @staticmethod
+    def loads(s, *args, **kwargs):
+        if args or kwargs:
+            return json.loads(s, *args, **kwargs)
+        return orjson.loads(s)
+
+    def __getattr__(self, name):
+        return getattr(json, name)
+
+
+# 只替换 bilibili_api 命名空间中的引用，不修改全局的 json 模块
+if orjson is not None and getattr(_bili_network, "json", None) is json:
+    _bili_network.json = _OrjsonModule()
+
+# 通过管道把音视频流直接交给 ffmpeg 依赖 pass_fds，仅类 Unix 系统可用
+try:
+    import fcntl
+
+    HAS_PIPE_MERGE = True
+except ImportError:
+    fcntl = None
+    HAS_PIPE_MERGE = False
+
+# HTTP/2 需要 h2，未安装时退回 HTTP/1.1。h2 由 httpx 自行导入，这里只检查是否已安装
+HAS_HTTP2 = importlib.util.find_spec("h2") is not None
+
+
+def create_download_client() -> httpx.AsyncClient:
+    """
+        创建视频、音频下载共用的客户端，复用连接与 TLS 握手
+    :return:
+    """
+    return httpx.AsyncClient(
+        transport=httpx.AsyncHTTPTransport(local_address="0.0.0.0", http2=HAS_HTTP2, retries=1),
+        headers=BILIBILI_HEADER,
+        timeout=30
+    )
+
+
+async def _stream_download(client: httpx.AsyncClient, url, write_chunk, progress_callback):
+    """
+        下载文件，并把每个分块交给 write_chunk 写出
+    :param client: 共用的下载客户端
     :param url:
-    :param full_file_name:
+    :param write_chunk: 接收一个分块的协程函数
     :param progress_callback:
     :return:
     """
-    async with httpx.AsyncClient(transport=httpx.AsyncHTTPTransport(local_address="0.0.0.0")) as client:
-        async with client.stream("GET", url, headers=BILIBILI_HEADER) as resp:
+    # 读取网络与写出分离：有界队列既能让两者重叠，又能限制内存占用
+    queue: asyncio.Queue = asyncio.Queue(maxsize=8)
+
+    async def producer():
+        async with client.stream("GET", url) as resp:
             current_len = 0
+            last_report_len = 0
             total_len = int(resp.headers.get('content-length', 0))
-            print(total_len)
-            async with aiofiles.open(full_file_name, "wb") as f:
-                async for chunk in resp.aiter_bytes():
-                    current_len += len(chunk)
-                    await f.write(chunk)
+            async for chunk in resp.aiter_bytes(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                current_len += len(chunk)
+                await queue.put(chunk)
+                if total_len and (current_len - last_report_len >= PROGRESS_STEP or current_len >= total_len):
+                    last_report_len = current_len
                     progress_callback(f'下载进度：{round(current_len / total_len, 3)}')
+        # 以 None 作为结束标记
+        await queue.put(None)
+
+    async def consumer():
+        while (chunk := await queue.get()) is not None:
+            await write_chunk(chunk)
+
+    tasks = [asyncio.create_task(producer()), asyncio.create_task(consumer())]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        # 任意一方出错时取消另一方，避免其永远阻塞在队列上
+        for task in tasks:
+            task.cancel()
+
+
+async def download_b_file(client: httpx.AsyncClient, url, full_file_name, progress_callback):
+    """
+        下载视频文件和音频文件
+    :param client: 共用的下载客户端
+    :param url:
+    :param full_file_name:
+    :param progress_callback:
+    :return:
+    """
+    with open(full_file_name, "wb", buffering=1024 * 1024) as f:
+        async def write_chunk(chunk):
+            f.write(chunk)
+
+        await _stream_download(client, url, write_chunk, progress_callback)
+
+
+def _write_all(pipe, chunk: bytes):
+    """
+        把整块数据写入无缓冲的管道，处理一次只写入部分数据的情况
+    :param pipe: 管道写端的文件对象
+    :param chunk: 要写入的数据
+    :return:
+    """
+    view = memoryview(chunk)
+    while view:
+        view = view[pipe.write(view):]
+
+
+async def download_b_file_to_pipe(client: httpx.AsyncClient, url, pipe, progress_callback):
+    """
+        下载视频文件或音频文件，直接写入 ffmpeg 的输入管道，写完后关闭管道
+    :param client: 共用的下载客户端
+    :param url:
+    :param pipe: 管道写端的文件对象
+    :param progress_callback:
+    :return:
+    """
+    async def write_chunk(chunk):
+        # 管道写满时会阻塞到 ffmpeg 读取为止，放到线程中执行以免卡住事件循环
+        await asyncio.to_thread(_write_all, pipe, chunk)
+
+    try:
+        await _stream_download(client, url, write_chunk, progress_callback)
+    finally:
+        await asyncio.to_thread(pipe.close)
+
+
+def _build_merge_args(video_input: str, audio_input: str, output_file_name: str):
+    """
+        构建合并音视频的 ffmpeg 参数列表
+    :param video_input: 视频输入（文件路径或 pipe:N）
+    :param audio_input: 音频输入（文件路径或 pipe:N）
+    :param output_file_name: 输出文件路径
+    :return:
+    """
+    return [
+        'ffmpeg', '-y', '-nostdin', '-loglevel', 'error', '-threads', '0',
+        '-fflags', '+genpts', '-i', video_input,
+        '-fflags', '+genpts', '-i', audio_input,
+        # moov 前置，客户端无需下载完整文件即可开始播放
+        '-c', 'copy', '-movflags', '+faststart', output_file_name
+    ]
 
 
 async def merge_file_to_mp4(v_full_file_name: str, a_full_file_name: str, output_file_name: str,
@@ -49,27 +223,135 @@ async def merge_file_to_mp4(v_full_file_name: str, a_full_file_name: str, output
     """
     logger.info(f'正在合并：{output_file_name}')
 
-    # 构建 ffmpeg 命令
-    command = f'ffmpeg -y -i "{v_full_file_name}" -i "{a_full_file_name}" -c copy "{output_file_name}"'
     stdout = None if log_output else subprocess.DEVNULL
     stderr = None if log_output else subprocess.DEVNULL
 
-    if platform.system() == "Windows":
-        # Windows 下使用 run_in_executor
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(
-            None,
-            lambda: subprocess.call(command, shell=True, stdout=stdout, stderr=stderr)
-        )
-    else:
-        # 其他平台使用 create_subprocess_shell
-        process = await asyncio.create_subprocess_shell(
-            command,
-            shell=True,
+    # 直接以参数列表启动 ffmpeg，不经过 shell，也无需处理路径的引号转义
+    process = await asyncio.create_subprocess_exec(
+        *_build_merge_args(v_full_file_name, a_full_file_name, output_file_name),
+        stdout=stdout,
+        stderr=stderr
+    )
+    await process.wait()
+    if process.returncode != 0:
+        await _discard_output(output_file_name)
+        raise RuntimeError(f'ffmpeg 合并失败，返回码：{process.returncode}')
+
+
+async def _discard_output(output_file_name: str):
+    """
+        删除合并失败时残留的不完整输出文件
+    :param output_file_name: 输出文件路径
+    :return:
+    """
+    try:
+        await asyncio.to_thread(os.remove, output_file_name)
+    except FileNotFoundError:
+        pass
+
+
+def _open_ffmpeg_pipe():
+    """
+        创建传给 ffmpeg 的管道，返回 (读端 fd, 写端文件对象)
+    :return:
+    """
+    read_fd, write_fd = os.pipe()
+    # Linux 下把管道容量调到 1MB，减少写入方的阻塞与系统调用次数
+    if hasattr(fcntl, "F_SETPIPE_SZ"):
+        try:
+            fcntl.fcntl(write_fd, fcntl.F_SETPIPE_SZ, 1024 * 1024)
+        except OSError:
+            pass
+    # 不使用缓冲：ffmpeg 提前退出时 close 不会因为刷新缓冲区再抛出 BrokenPipeError，掩盖原本的错误
+    return read_fd, os.fdopen(write_fd, "wb", buffering=0)
+
+
+async def download_merge_to_mp4(client: httpx.AsyncClient, video_url: str, audio_url: str, output_file_name: str,
+                                log_output: bool = False):
+    """
+    边下载边合并：视频流和音频流经管道直接交给 ffmpeg，不落地中间的 m4s 文件
+    :param client: 共用的下载客户端
+    :param video_url: 视频流链接
+    :param audio_url: 音频流链接
+    :param output_file_name: 输出文件路径
+    :param log_output: 是否显示 ffmpeg 输出日志，默认忽略
+    :return:
+    """
+    logger.info(f'正在合并：{output_file_name}')
+    stdout = None if log_output else subprocess.DEVNULL
+    stderr = None if log_output else subprocess.DEVNULL
+
+    v_read_fd, v_pipe = _open_ffmpeg_pipe()
+    a_read_fd, a_pipe = _open_ffmpeg_pipe()
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *_build_merge_args(f'pipe:{v_read_fd}', f'pipe:{a_read_fd}', output_file_name),
+            stdin=subprocess.DEVNULL,
             stdout=stdout,
-            stderr=stderr
+            stderr=stderr,
+            pass_fds=(v_read_fd, a_read_fd)
         )
-        await process.communicate()
+    except Exception:
+        v_pipe.close()
+        a_pipe.close()
+        raise
+    finally:
+        # 读端已交给 ffmpeg，父进程不再持有
+        os.close(v_read_fd)
+        os.close(a_read_fd)
+
+    try:
+        await asyncio.gather(
+            download_b_file_to_pipe(client, video_url, v_pipe, logger.debug),
+            download_b_file_to_pipe(client, audio_url, a_pipe, logger.debug))
+    except BaseException:
+        # ffmpeg 拒绝输入流后会先退出，写入方随后才遇到 BrokenPipeError，此时进程已不存在
+        if process.returncode is None:
+            with contextlib.suppress(ProcessLookupError):
+                process.kill()
+        await process.wait()
+        await _discard_output(output_file_name)
+        raise
+    await process.wait()
+    if process.returncode != 0:
+        await _discard_output(output_file_name)
+        raise RuntimeError(f'ffmpeg 合并失败，返回码：{process.returncode}')
+
+
+# 同一链接经常被反复发送，短时间内复用接口结果，省去重复的网络请求
+@alru_cache(maxsize=256, ttl=300)
+async def _get_video_info_cached(video_id: str, credential: Credential):
+    return await video.Video(video_id, credential=credential).get_info()
+
+
+@alru_cache(maxsize=256, ttl=600)
+async def _get_ai_conclusion_cached(video_id: str, cid: int, credential: Credential):
+    return await video.Video(video_id, credential=credential).get_ai_conclusion(cid=cid)
+
+
+# 直播状态变化较快，缓存时间较短
+@alru_cache(maxsize=64, ttl=30)
+async def _get_room_info_cached(room_id: int):
+    return await live.LiveRoom(room_display_id=room_id).get_room_info()
+
+
+@alru_cache(maxsize=256, ttl=600)
+async def _get_opus_info_cached(dynamic_id: int, credential: Credential):
+    return await Opus(dynamic_id, credential).get_info()
+
+
+def _dig(data, *path, default=None):
+    """
+        按路径逐层读取嵌套字典，任意一层不存在或不是字典时返回默认值
+    """
+    current = data
+    for key in path:
+        if not isinstance(current, dict):
+            return default
+        current = current.get(key)
+        if current is None:
+            return default
+    return current
 
 
 def extra_bili_info(video_info):
@@ -77,29 +359,11 @@ def extra_bili_info(video_info):
         格式化视频信息
     """
     video_state = video_info['stat']
-    video_like, video_coin, video_favorite, video_share, video_view, video_danmaku, video_reply = video_state['like'], \
-        video_state['coin'], video_state['favorite'], video_state['share'], video_state['view'], video_state['danmaku'], \
-        video_state['reply']
-
-    video_data_map = {
-        "点赞": video_like,
-        "硬币": video_coin,
-        "收藏": video_favorite,
-        "分享": video_share,
-        "总播放量": video_view,
-        "弹幕数量": video_danmaku,
-        "评论": video_reply
-    }
-
-    video_info_result = ""
-    for key, value in video_data_map.items():
-        if int(value) > 10000:
-            formatted_value = f"{value / 10000:.1f}万"
-        else:
-            formatted_value = value
-        video_info_result += f"{key}: {formatted_value} | "
-
-    return video_info_result
+    parts = [
+        f"{label}: {value / 10000:.1f}万" if (value := video_state[key]) > 10000 else f"{label}: {value}"
+        for label, key in _STAT_FIELDS
+    ]
+    return " | ".join(parts) + " | "
 
 
 async def process_bilibili_url(event: AstrMessageEvent, credential: Credential, video_duration_maximum: int):
@@ -109,21 +373,23 @@ async def process_bilibili_url(event: AstrMessageEvent, credential: Credential,
     # 1. URL 预处理
     # 当前收到的消息
     url: str = event.message_str.strip()
-    url_reg = r"(http:|https:)\/\/(space|www|live|t).bilibili.com\/[A-Za-z\d._?%&+\-=\/#]*"
-    b_short_rex = r"(https?://(?:b23\.tv|bili2233\.cn)/[A-Za-z\d._?%&+\-=\/#]+)"
     # BV处理
-    if re.match(r'^BV[1-9a-zA-Z]{10}$', url, re.IGNORECASE):
+    if _BV_RE.match(url):
         url = 'https://www.bilibili.com/video/' + url
     # 处理短号、小程序问题
     if "b23.tv" in url or "bili2233.cn" in url:
         try:
-            b_short_match = re.search(b_short_rex, url.replace("\\", ""))
+            b_short_match = _SHORT_RE.search(url.replace("\\", ""))
             if not b_short_match:
                 yield event.plain_result("错误：B站短链接解析失败。")
                 return
             b_short_url = b_short_match.group(0)
             async with httpx.AsyncClient(headers=BILIBILI_HEADER, follow_redirects=True) as client:
-                resp = await client.get(b_short_url)
+                # 只需要跳转后的地址，用 HEAD 省去下载页面正文
+                resp = await client.head(b_short_url)
+                # 部分节点不支持 HEAD，没有发生跳转时退回 GET
+                if not resp.history:
+                    resp = await client.get(b_short_url)
                 url: str = str(resp.url)
         except (TypeError, httpx.RequestError):
             yield event.plain_result("错误：B站短链接解析失败。")
@@ -134,58 +400,36 @@ async def process_bilibili_url(event: AstrMessageEvent, credential: Credential,
         try:
             if '?' in url:
                 url = url[:url.index('?')]
-            dynamic_match = re.search(r'[^/]+(?!.*/)', url)
+            dynamic_match = _DYN_RE.search(url)
             if not dynamic_match:
                 yield event.plain_result("无法识别动态ID。")
                 return
             dynamic_id = int(dynamic_match.group(0))
-            opus = Opus(dynamic_id, credential)
             # Opus.get_content() might not be available, using get_opus_info() instead
             # Since get_opus_info() might not be available either, fallback to a more basic approach
             try:
-                dynamic_info = await opus.get_info()
+                dynamic_info = await _get_opus_info_cached(dynamic_id, credential)
             except AttributeError:
                 # If get_info() is not available, use a basic dictionary
                 dynamic_info = { }
 
-            # 提取内容
-            desc = ""
-            user_name = "未知UP主"
-
-            # 尝试不同的数据结构格式获取内容
-            if 'desc' in dynamic_info and isinstance(dynamic_info['desc'], dict) and 'text' in dynamic_info['desc']:
-                desc = dynamic_info['desc']['text']
-            elif 'item' in dynamic_info and isinstance(dynamic_info['item'], dict) and 'description' in dynamic_info[
-                'item']:
-                desc = dynamic_info['item']['description']
-
-            if 'user' in dynamic_info and isinstance(dynamic_info['user'], dict) and 'name' in dynamic_info['user']:
-                user_name = dynamic_info['user']['name']
-            elif 'card' in dynamic_info and isinstance(dynamic_info['card'], dict) and 'card' in dynamic_info['card']:
-                card = dynamic_info['card']['card']
-                if isinstance(card, dict) and 'user' in card and isinstance(card['user'], dict) and 'name' in card[
-                    'user']:
-                    user_name = card['user']['name']
+            # 提取内容，兼容不同的数据结构
+            desc = _dig(dynamic_info, 'desc', 'text') or _dig(dynamic_info, 'item', 'description') or ""
+            user_name = (_dig(dynamic_info, 'user', 'name')
+                         or _dig(dynamic_info, 'card', 'card', 'user', 'name')
+                         or "未知UP主")
 
             # 提取图片
-            pics = []
-            if isinstance(dynamic_info, dict):
-                # 尝试不同的数据结构格式获取图片
-                if 'pictures' in dynamic_info and isinstance(dynamic_info['pictures'], list):
-                    for p in dynamic_info['pictures']:
-                        if isinstance(p, dict) and 'img_src' in p:
-                            pics.append(p['img_src'])
-                elif 'item' in dynamic_info and isinstance(dynamic_info['item'], dict) and 'pictures' in dynamic_info[
-                    'item']:
-                    for p in dynamic_info['item']['pictures']:
-                        if isinstance(p, dict) and 'img_src' in p:
-                            pics.append(p['img_src'])
+            pictures = _dig(dynamic_info, 'pictures')
+            if not isinstance(pictures, list):
+                pictures = _dig(dynamic_info, 'item', 'pictures') or []
+            pics = [p['img_src'] for p in pictures if isinstance(p, dict) and 'img_src' in p]
 
             message_chain = [Comp.Plain(f"识别到B站动态 (来自: {user_name}):\n{desc}")]
             if pics:
                 message_chain.append(Comp.Plain("\n附带图片如下："))
-                for pic_url in pics[:9]:  # 最多发9张图
-                    message_chain.append(Comp.Image.fromURL(pic_url))
+                # 最多发9张图
+                message_chain.extend(Comp.Image.fromURL(pic_url) for pic_url in islice(pics, 9))
 
             yield event.chain_result(message_chain)
             return
@@ -195,14 +439,13 @@ async def process_bilibili_url(event: AstrMessageEvent, credential: Credential,
     # ================== 直播间解析 ==================
     if 'live.bilibili.com' in url:
         try:
-            room_id_match = re.search(r'\/(\d+)', url.split('?')[0])
+            room_id_match = _ROOM_RE.search(url.split('?')[0])
             if not room_id_match:
                 yield event.plain_result("无法识别直播间ID。")
                 return
 
             room_id = int(room_id_match.group(1))
-            room = live.LiveRoom(room_display_id=room_id)
-            room_info = (await room.get_room_info())['room_info']
+            room_info = (await _get_room_info_cached(room_id))['room_info']
             title, cover, keyframe = room_info['title'], room_info['cover'], room_info['keyframe']
 
             yield event.chain_result([
@@ -218,7 +461,7 @@ async def process_bilibili_url(event: AstrMessageEvent, credential: Credential,
     # ================== 专栏解析 ==================
     if '/read/cv' in url:
         try:
-            cv_match = re.search(r'cv(\d+)', url)
+            cv_match = _CV_RE.search(url)
             if not cv_match:
                 yield event.plain_result("无法识别专栏ID。")
                 return
@@ -237,7 +480,7 @@ async def process_bilibili_url(event: AstrMessageEvent, credential: Credential,
     # ================== 收藏夹解析 (需要SESSDATA) ==================
     if 'favlist' in url and credential:
         try:
-            fid_match = re.search(r'fid=(\d+)', url)
+            fid_match = _FID_RE.search(url)
             if not fid_match:
                 yield event.plain_result("无法识别收藏夹ID。")
                 return
@@ -253,20 +496,35 @@ async def process_bilibili_url(event: AstrMessageEvent, credential: Credential,
     # 确保URL是有效的视频链接
     if 'video/av' not in url and 'video/BV' not in url:
         # 如果前面的逻辑都没匹配上，并且不是视频链接，则放弃
-        search_res = re.search(url_reg, url)
+        search_res = _URL_RE.search(url)
         if search_res:
             yield event.plain_result(f"已识别链接，但暂不支持解析此类型：{search_res.group(0)}")
         return
-    # 获取视频信息
-    video_id_match = re.search(r"video\/([^\?\/ ]+)", url)
-    if not video_id_match:
+    # 先从消息中取出链接，再解析一次链接，同时得到视频ID与分P
+    video_url_match = _VIDEO_URL_RE.search(url)
+    if not video_url_match:
+        yield event.plain_result("无法从链接中提取有效的视频ID。")
+        return
+    parsed_url = urlparse(video_url_match.group(0))
+    video_id = parsed_url.path.split('/video/', 1)[-1].split('/', 1)[0]
+    if not video_id:
         yield event.plain_result("无法从链接中提取有效的视频ID。")
         return
-    video_id = video_id_match.group(1)
+    page = parse_qs(parsed_url.query).get('p', ['1'])[0]
+    page_num = max(int(page) - 1, 0) if page.isdecimal() else 0
 
     v = video.Video(video_id, credential=credential)
-    video_info = await v.get_info()
+    # 三个请求互不依赖（分P已从链接中得到），并发发出。
+    # 各自的异常单独处理，下载链接获取失败时仍然先发送视频信息
+    video_info, online, download_url_data = await asyncio.gather(
+        _get_video_info_cached(video_id, credential),
+        v.get_online(),
+        v.get_download_url(page_index=page_num),
+        return_exceptions=True)
 
+    if isinstance(video_info, BaseException):
+        logger.error(f"B站视频信息获取失败: {video_info}")
+        video_info = None
     if video_info is None:
         yield event.plain_result(f"识别：B站，出错，无法获取数据！")
         return
@@ -275,18 +533,7 @@ async def process_bilibili_url(event: AstrMessageEvent, credential: Credential,
         'desc'], \
         video_info['duration']
     # 校准 分p 的情况
-    page_num = 0
     if 'pages' in video_info:
-        # 解析URL
-        parsed_url = urlparse(url)
-        # 检查是否有查询字符串
-        if parsed_url.query:
-            # 解析查询字符串中的参数
-            query_params = parse_qs(parsed_url.query)
-            # 获取指定参数的值，如果参数不存在，则返回None
-            page_num = int(query_params.get('p', [1])[0]) - 1
-        else:
-            page_num = 0
         if 'duration' in video_info['pages'][page_num]:
             video_duration = video_info['pages'][page_num].get('duration', video_info.get('duration'))
         else:
@@ -295,8 +542,11 @@ async def process_bilibili_url(event: AstrMessageEvent, credential: Credential,
     # 删除特殊字符
     video_title = delete_boring_characters(video_title)
     # 截断下载时间比较长的视频
-    online = await v.get_online()
-    online_str = f'🏄‍♂️ 总共 {online["total"]} 人在观看，{online["count"]} 人在网页端观看'
+    if isinstance(online, BaseException):
+        logger.warning(f"B站在线人数获取失败: {online}")
+        online_str = ''
+    else:
+        online_str = f'🏄‍♂️ 总共 {online["total"]} 人在观看，{online["count"]} 人在网页端观看'
     # 检查时长
     if video_duration <= video_duration_maximum:
         yield event.chain_result([
@@ -310,22 +560,35 @@ async def process_bilibili_url(event: AstrMessageEvent, credential: Credential,
             Comp.Plain(
                 f"\n识别：B站，{video_title}\n{extra_bili_info(video_info)}\n简介：{video_desc}\n{online_str}\n---------\n⚠️ 当前视频时长 {video_duration // 60} 分钟，超过管理员设置的最长时间 {video_duration_maximum // 60} 分钟！")
         ])
-    # 获取下载链接
-    download_url_data = await v.get_download_url(page_index=page_num)
+    if isinstance(download_url_data, BaseException):
+        logger.error(f"B站视频下载链接获取失败: {download_url_data}")
+        yield event.plain_result(f"B站视频下载链接获取失败: {download_url_data}")
+        return
+    # 解析下载链接
     detecter = VideoDownloadURLDataDetecter(download_url_data)
     streams = detecter.detect_best_streams()
     video_url, audio_url = streams[0].url, streams[1].url
     # 下载视频和音频
-    download_path = os.getcwd() + "/data/bilibili_cache/" + video_id
-    os.makedirs(download_path, exist_ok=True)
+    download_path = str(CACHE_DIR / video_id)
     try:
-        await asyncio.gather(
-            download_b_file(video_url, f"{download_path}-video.m4s", logger.debug),
-            download_b_file(audio_url, f"{download_path}-audio.m4s", logger.debug))
-        await merge_file_to_mp4(f"{download_path}-video.m4s", f"{download_path}-audio.m4s", f"{download_path}.mp4")
-    finally:
-        remove_res = remove_files([f"{download_path}-video.m4s", f"{download_path}-audio.m4s"])
-        logger.info(remove_res)
+        async with create_download_client() as client:
+            if HAS_PIPE_MERGE:
+                await download_merge_to_mp4(client, video_url, audio_url, f"{download_path}.mp4")
+            else:
+                try:
+                    await asyncio.gather(
+                        download_b_file(client, video_url, f"{download_path}-video.m4s", logger.debug),
+                        download_b_file(client, audio_url, f"{download_path}-audio.m4s", logger.debug))
+                    await merge_file_to_mp4(f"{download_path}-video.m4s", f"{download_path}-audio.m4s",
+                                            f"{download_path}.mp4")
+                finally:
+                    remove_res = await remove_files_async([f"{download_path}-video.m4s", f"{download_path}-audio.m4s"])
+                    logger.info(remove_res)
+    except Exception as e:
+        # 下载或合并失败时不发送残缺的视频
+        logger.error(f"B站视频下载失败: {e}")
+        yield event.plain_result(f"B站视频下载失败: {e}")
+        return
     # 发送出去
     logger.info(f"{download_path}.mp4")
     yield event.chain_result([Comp.Video.fromFileSystem(path=f"{download_path}.mp4")])
@@ -333,7 +596,7 @@ async def process_bilibili_url(event: AstrMessageEvent, credential: Credential,
     if credential:
         try:
             cid = video_info['pages'][page_num]['cid']
-            ai_conclusion = await v.get_ai_conclusion(cid=cid)
+            ai_conclusion = await _get_ai_conclusion_cached(video_id, cid, credential)
             if ai_conclusion and ai_conclusion.get('summary'):
                 summary_text = f"【Bilibili AI 总结】\n{ai_conclusion['summary']}"
                 yield event.plain_result(summary_text)
@@ -1,17 +1,90 @@
-import re
+import asyncio
 import os
-from typing import List, Dict, Any, Union, Sequence, Optional
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from typing import List, Dict, Any, Union, Sequence, Optional, Callable, Awaitable, AsyncGenerator
 
+import aiohttp
 import astrbot.api.message_components as Comp
+import httpx
+from astrbot.api import logger
 from astrbot.api.event import AstrMessageEvent
 
+# 批量下载图片时的 worker 数量，避免一次打开过多连接触发风控
+DOWNLOAD_WORKERS = 4
+# Content-Length 小于该值的文件一次性读入内存，更大的或未知大小的仍然分块流式读取
+SMALL_DOWNLOAD_LIMIT = 8 << 20
+# 短时间内连续产出的消息合并发送：最多合并的条数与等待下一条消息的时间（秒）
+COALESCE_MAX_ITEMS = 8
+COALESCE_MAX_WAIT = 0.02
+
+# 插件生命周期内共用的 HTTP 会话，复用连接池，避免每次请求重新握手
+_SESSION: Optional[aiohttp.ClientSession] = None
+_HTTP_CLIENT: Optional[httpx.AsyncClient] = None
+
+
+def get_session() -> aiohttp.ClientSession:
+    """
+    获取共用的 aiohttp 会话，首次调用时创建
+
+    :return: aiohttp.ClientSession
+    """
+    global _SESSION
+    if _SESSION is None or _SESSION.closed:
+        _SESSION = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=100, limit_per_host=16, keepalive_timeout=60, ttl_dns_cache=300),
+            # 不同请求之间不共享 Cookie
+            cookie_jar=aiohttp.DummyCookieJar()
+        )
+    return _SESSION
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    获取共用的 httpx 客户端，首次调用时创建
+
+    :return: httpx.AsyncClient
+    """
+    global _HTTP_CLIENT
+    if _HTTP_CLIENT is None or _HTTP_CLIENT.is_closed:
+        _HTTP_CLIENT = httpx.AsyncClient(
+            limits=httpx.Limits(max_keepalive_connections=20),
+            # 拒绝保存响应中的 Cookie：客户端被所有用户共用，保存下来会在不同用户的请求和重定向之间串用。
+            # 需要的 Cookie 由调用方通过请求头逐次传入
+            cookies=CookieJar(policy=DefaultCookiePolicy(allowed_domains=[]))
+        )
+    return _HTTP_CLIENT
+
+
+async def close_sessions() -> None:
+    """
+    关闭共用的 HTTP 会话，插件卸载时调用
+    """
+    global _SESSION, _HTTP_CLIENT
+    if _SESSION is not None:
+        await _SESSION.close()
+        _SESSION = None
+    if _HTTP_CLIENT is not None:
+        await _HTTP_CLIENT.aclose()
+        _HTTP_CLIENT = None
+
+# 标题中需要去除的字符：数字、标点以及所有空白字符
+_BORING_CHARACTERS = (
+    "0123456789'!\"∀〃#$%&()*+,-./:;<=>?@，。★、…【】《》？！[]^_`{|}~～"
+    " \t\n\r\v\f\x1c\x1d\x1e\x1f\x85\xa0\u1680\u2000\u2001\u2002\u2003\u2004\u2005"
+    "\u2006\u2007\u2008\u2009\u200a\u2028\u2029\u202f\u205f\u3000"
+)
+_BORING_TABLE = str.maketrans("", "", _BORING_CHARACTERS)
+
+
 def delete_boring_characters(sentence):
     """
         去除标题的特殊字符
     :param sentence:
     :return:
     """
-    return re.sub(r'[0-9\'!"∀〃#$%&\'()*+,-./:;<=>?@，。?★、…【】《》？""''！[\\]^_`{|}~～\s]+', "", sentence)
+    # 保持同步直接调用：标题很短，translate 只需微秒级，
+    # 用 asyncio.to_thread 包一层反而会被线程调度开销拖慢
+    return sentence.translate(_BORING_TABLE)
 
 def remove_files(file_paths: List[str]) -> Dict[str, str]:
     """
@@ -37,6 +110,65 @@ def remove_files(file_paths: List[str]) -> Dict[str, str]:
 
     return results
 
+async def remove_files_async(file_paths: List[str]) -> Dict[str, str]:
+    """
+    并发删除文件，不阻塞事件循环
+
+    Parameters:
+    file_paths (List[str]): 要删除的文件路径
+
+    Returns:
+    dict: 一个以文件路径为键、删除状态为值的字典
+    """
+    results = { }
+
+    async def remove_one(file_path: str):
+        try:
+            await asyncio.to_thread(os.remove, file_path)
+            results[file_path] = 'remove'
+        except FileNotFoundError:
+            results[file_path] = 'don\'t exist'
+        except Exception as e:
+            results[file_path] = f'error: {e}'
+
+    await asyncio.gather(*(remove_one(file_path) for file_path in file_paths))
+    return results
+
+async def download_all(urls: Sequence[str], download: Callable[[str], Awaitable[Any]],
+                       workers: int = DOWNLOAD_WORKERS) -> List[Any]:
+    """
+    通过有界队列交给固定数量的 worker 批量下载，同时进行的下载数不超过 workers。
+    单个链接下载失败只记录日志，对应位置返回 None，不影响其余链接
+
+    :param urls: 要下载的链接
+    :param download: 下载单个链接的协程函数
+    :param workers: worker 数量
+    :return: 与 urls 顺序一致的下载结果，失败的位置为 None
+    """
+    results: List[Any] = [None] * len(urls)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=16)
+
+    async def worker():
+        while True:
+            index, url = await queue.get()
+            try:
+                results[index] = await download(url)
+            except Exception as e:
+                # 吞掉异常而不是让 worker 退出，否则 queue.join() 将永远等待
+                logger.error(f"下载失败 {url}: {e}")
+            finally:
+                queue.task_done()
+
+    tasks = [asyncio.create_task(worker()) for _ in range(min(workers, len(urls)))]
+    try:
+        for item in enumerate(urls):
+            await queue.put(item)
+        await queue.join()
+    finally:
+        for task in tasks:
+            task.cancel()
+    return results
+
 def create_forward_message(content_list: List[Union[List[Any], Dict[str, Any]]], 
                           default_name: Optional[str] = None, 
                           default_uin: Optional[Union[int, str]] = None) -> Comp.Nodes:
@@ -114,4 +246,98 @@ async def send_forward_message(event: AstrMessageEvent,
         default_uin = event.get_sender_id()
         
     nodes = create_forward_message(content_list, default_name, default_uin)
-    return event.chain_result([nodes])
\ No newline at end of file
+    return event.chain_result([nodes])
+
+
+def _can_coalesce(result: Any) -> bool:
+    """
+    判断一条结果能否和相邻的结果合并为一条消息。
+    只合并文本和网络/内存图片；视频、合并转发需要单独发送，
+    本地文件可能在生成器恢复执行后就被删除，也不参与合并
+
+    :param result: 生成器产出的结果
+    :return: 能否合并
+    """
+    chain = getattr(result, "chain", None)
+    if not chain:
+        return False
+    for component in chain:
+        if isinstance(component, Comp.Plain):
+            continue
+        if isinstance(component, Comp.Image) and not component.path:
+            continue
+        return False
+    return True
+
+
+def _merge_results(batch: List[Any]) -> Any:
+    """
+    将多条结果拼接为一条，各结果之间以换行分隔
+
+    :param batch: 可合并的结果
+    :return: 合并后的结果
+    """
+    merged = batch[0]
+    for result in batch[1:]:
+        merged.chain.append(Comp.Plain("\n"))
+        merged.chain.extend(result.chain)
+    return merged
+
+
+async def coalesce_results(results: AsyncGenerator[Any, None], max_items: int = COALESCE_MAX_ITEMS,
+                           max_wait: float = COALESCE_MAX_WAIT) -> AsyncGenerator[Any, None]:
+    """
+    将生成器在 max_wait 秒内连续产出的文本/图片结果合并为一条消息，减少发送次数
+
+    :param results: process_* 返回的异步生成器
+    :param max_items: 一条消息最多合并的结果数
+    :param max_wait: 已有待发送结果时，等待下一条结果的最长时间
+    :return: 异步生成合并后的结果
+    """
+    batch = []
+    # 用任务获取下一条结果，等待超时也不会取消生成器本身
+    next_result = None
+    try:
+        while True:
+            if next_result is None:
+                next_result = asyncio.ensure_future(results.__anext__())
+            if batch:
+                done, _ = await asyncio.wait((next_result,), timeout=max_wait)
+                if not done:
+                    yield _merge_results(batch)
+                    batch = []
+                    continue
+            try:
+                result = await next_result
+            except StopAsyncIteration:
+                break
+            except Exception:
+                if batch:
+                    yield _merge_results(batch)
+                    batch = []
+                raise
+            finally:
+                if next_result.done():
+                    next_result = None
+
+            if not _can_coalesce(result):
+                if batch:
+                    yield _merge_results(batch)
+                    batch = []
+                # 生成器恢复执行前，确保这条结果已经发送完毕
+                yield result
+                continue
+            batch.append(result)
+            if len(batch) >= max_items:
+                yield _merge_results(batch)
+                batch = []
+        if batch:
+            yield _merge_results(batch)
+    finally:
+        if next_result is not None:
+            next_result.cancel()
+            try:
+                await next_result
+            except BaseException:
+                pass
+        await results.aclose()
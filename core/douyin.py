@@ -1,18 +1,25 @@
+import contextlib
 import os
 import random
 import re
-import time
+import threading
 import asyncio
 from typing import List, Tuple, Optional, AsyncGenerator
 
 import astrbot.api.message_components as Comp
-import httpx
-import aiohttp
 from astrbot.api import logger
 from astrbot.api.event import AstrMessageEvent
 
 from ..constants.douyin import DOUYIN_HEADER, DOUYIN_VIDEO_API, DOUYIN_TOUTIAO_API, URL_TYPE_CODE_DICT
-from .common import create_forward_message, send_forward_message
+from .common import create_forward_message, send_forward_message, get_http_client
+
+# 优先使用进程内的 V8 (mini-racer) 执行签名脚本，避免 execjs 每次调用都启动一个 Node 子进程
+try:
+    from py_mini_racer import MiniRacer
+
+    HAS_MINI_RACER = True
+except ImportError:
+    HAS_MINI_RACER = False
 
 # 尝试导入execjs，但即使导入失败也不影响基本功能
 try:
@@ -21,10 +28,26 @@ try:
 
     HAS_EXECJS = True
 except ImportError:
-    logger.warning("execjs not installed, X-Bogus signature generation will be skipped")
+    if not HAS_MINI_RACER:
+        logger.warning("execjs not installed, X-Bogus signature generation will be skipped")
     HAS_EXECJS = False
     import urllib.parse
 
+# 预编译的正则
+_DY_SHORT = re.compile(r"(http:|https:)//v.douyin.com/[A-Za-z\d._?%&+\-=#]*", re.I)
+_DY_ID = re.compile(r"(video|note)/(\d+)", re.I)
+_DY_SLIDE = re.compile(r"share/slides/(\d+)")
+
+# A-Bogus JS文件路径与默认 UA 在导入时确定，签名时不再重复计算
+_ABOGUS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'core', 'a-bogus.js')
+_UA = DOUYIN_HEADER['User-Agent']
+
+# 编译好的 A-Bogus JS 上下文，首次签名时创建
+_ABOGUS_CTX = None
+_ABOGUS_LOCK = threading.Lock()
+# 同一个 MiniRacer 实例不能被多个线程同时调用
+_ABOGUS_CALL_LOCK = threading.Lock() if HAS_MINI_RACER else contextlib.nullcontext()
+
 # 临时目录设置 - 使用标准化的路径格式
 DATA_DIR = os.path.join(os.getcwd(), "data")
 CACHE_DIR = os.path.join(DATA_DIR, "douyin_cache")
@@ -43,42 +66,57 @@ def generate_random_str(randomlength=16):
     param :randomlength
     return:random_str
     """
-    random_str = ''
     base_str = 'ABCDEFGHIGKLMNOPQRSTUVWXYZabcdefghigklmnopqrstuvwxyz0123456789='
-    length = len(base_str) - 1
-    for _ in range(randomlength):
-        random_str += base_str[random.randint(0, length)]
-    return random_str
+    return ''.join(random.choices(base_str, k=randomlength))
+
+
+def _get_abogus_context():
+    """
+    获取编译好的 A-Bogus JS 上下文，只在首次调用时读取并编译脚本
+    :return: MiniRacer 或 execjs 上下文，JS 文件不存在时返回 None
+    """
+    global _ABOGUS_CTX
+    if _ABOGUS_CTX is None:
+        with _ABOGUS_LOCK:
+            if _ABOGUS_CTX is None:
+                # 检查文件是否存在
+                if not os.path.exists(_ABOGUS_PATH):
+                    logger.warning(f"A-Bogus JS file not found at {_ABOGUS_PATH}")
+                    return None
+
+                # 读取JS文件并编译
+                with open(_ABOGUS_PATH, 'r', encoding='utf-8') as abogus_file:
+                    abogus_js = abogus_file.read()
+                if HAS_MINI_RACER:
+                    ctx = MiniRacer()
+                    # 脚本末尾使用了 CommonJS 的 module.exports
+                    ctx.eval("var module = { exports: {} };\n" + abogus_js)
+                    _ABOGUS_CTX = ctx
+                else:
+                    _ABOGUS_CTX = execjs.compile(abogus_js)
+    return _ABOGUS_CTX
 
 
 def generate_x_bogus_url(url, headers):
     """
-    生成抖音A-Bogus签名 (如果有execjs)
+    生成抖音A-Bogus签名 (如果有mini-racer或execjs)
     :param url: 视频链接
     :param headers: 请求头
     :return: 包含X-Bogus签名的URL
     """
-    if not HAS_EXECJS:
-        # 如果没有execjs，返回原始URL
+    if not (HAS_MINI_RACER or HAS_EXECJS):
+        # 如果没有可用的JS引擎，返回原始URL
         return url
 
     try:
         # 获取查询部分
         query = urllib.parse.urlparse(url).query
-        # A-Bogus JS文件路径
-        abogus_file_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'core',
-                                        'a-bogus.js')
-
-        # 检查文件是否存在
-        if not os.path.exists(abogus_file_path):
-            logger.warning(f"A-Bogus JS file not found at {abogus_file_path}")
+        abogus_ctx = _get_abogus_context()
+        if abogus_ctx is None:
             return url
 
-        # 读取JS文件并执行
-        with open(abogus_file_path, 'r', encoding='utf-8') as abogus_file:
-            abogus_js = abogus_file.read()
-
-        abogus = execjs.compile(abogus_js).call('generate_a_bogus', query, headers['User-Agent'])
+        with _ABOGUS_CALL_LOCK:
+            abogus = abogus_ctx.call('generate_a_bogus', query, headers.get('User-Agent', _UA))
         logger.debug(f'生成的A-Bogus签名为: {abogus}')
         return url + "&a_bogus=" + abogus
     except Exception as e:
@@ -94,9 +132,8 @@ async def get_douyin_slide_info(url: str) -> Tuple[Optional[str], Optional[str],
     """
     try:
         # 尝试使用第三方API解析
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(f"https://api.xingzhige.com/API/douyin/?url={url}")
-            data = resp.json()
+        resp = await get_http_client().get(f"https://api.xingzhige.com/API/douyin/?url={url}")
+        data = resp.json()
 
         data_content = data.get("data", { })
         item_id = data_content.get("jx", { }).get("item_id")
@@ -137,16 +174,15 @@ async def _get_douyin_slide_info_fallback(url: str) -> Tuple[Optional[str], Opti
             return None, None, None, []
 
         # 提取图集ID
-        slide_id_match = re.search(r"share\/slides\/(\d+)", real_url)
+        slide_id_match = _DY_SLIDE.search(real_url)
         if not slide_id_match:
             return None, None, None, []
 
         slide_id = slide_id_match.group(1)
         api_url = DOUYIN_VIDEO_API.format(slide_id)
 
-        async with httpx.AsyncClient(headers=DOUYIN_HEADER) as client:
-            resp = await client.get(api_url)
-            data = resp.json()
+        resp = await get_http_client().get(api_url, headers=DOUYIN_HEADER)
+        data = resp.json()
 
         if not data.get('item_list'):
             return None, None, None, []
@@ -174,7 +210,11 @@ async def get_redirect_url(url: str) -> Optional[str]:
     :return: 重定向后的URL或None
     """
     try:
-        response = httpx.get(url, headers=DOUYIN_HEADER, follow_redirects=False)
+        # 只需要响应头中的 location，用 HEAD 避免下载正文
+        response = await get_http_client().head(url, headers=DOUYIN_HEADER, follow_redirects=False, timeout=10)
+        # 部分节点不支持 HEAD（如返回 405），没有拿到跳转地址时退回 GET
+        if 'location' not in response.headers and response.status_code != 200:
+            response = await get_http_client().get(url, headers=DOUYIN_HEADER, follow_redirects=False, timeout=10)
         if 'location' in response.headers:
             return response.headers['location']
         return str(response.url) if response.status_code == 200 else None
@@ -183,45 +223,6 @@ async def get_redirect_url(url: str) -> Optional[str]:
         return None
 
 
-async def download_image(url: str, session: Optional[aiohttp.ClientSession] = None) -> Optional[str]:
-    """
-    下载图片到缓存目录
-    
-    :param url: 图片URL
-    :param session: 可选的 aiohttp 会话
-    :return: 本地文件路径或None
-    """
-    try:
-        # 生成唯一文件名
-        filename = f"img_{int(time.time())}_{random.randint(1000, 9999)}.jpg"
-        filepath = os.path.join(CACHE_DIR, filename)
-        
-        if session:
-            async with session.get(url) as response:
-                if response.status != 200:
-                    logger.error(f"下载图片失败，状态码: {response.status}")
-                    return None
-                    
-                with open(filepath, 'wb') as fd:
-                    async for chunk in response.content.iter_chunked(1024):
-                        fd.write(chunk)
-        else:
-            async with aiohttp.ClientSession() as new_session:
-                async with new_session.get(url) as response:
-                    if response.status != 200:
-                        logger.error(f"下载图片失败，状态码: {response.status}")
-                        return None
-                        
-                    with open(filepath, 'wb') as fd:
-                        async for chunk in response.content.iter_chunked(1024):
-                            fd.write(chunk)
-                            
-        return filepath
-    except Exception as e:
-        logger.error(f"下载图片异常: {e}")
-        return None
-
-
 async def process_douyin_url(event: AstrMessageEvent, douyin_ck: str = "") -> AsyncGenerator:
     """
     处理抖音链接
@@ -234,8 +235,7 @@ async def process_douyin_url(event: AstrMessageEvent, douyin_ck: str = "") -> As
     logger.info(f"处理抖音链接: {msg}")
 
     # 匹配抖音短链接
-    reg = r"(http:|https:)\/\/v.douyin.com\/[A-Za-z\d._?%&+\-=#]*"
-    douyin_match = re.search(reg, msg, re.I)
+    douyin_match = _DY_SHORT.search(msg)
 
     if not douyin_match:
         yield event.plain_result("无法识别抖音链接")
@@ -266,6 +266,8 @@ async def process_douyin_url(event: AstrMessageEvent, douyin_ck: str = "") -> As
                 
                 # 使用转发消息发送图片集
                 if images:
+                    image_urls = [image_url for image_url in images if image_url is not None]
+
                     # 创建消息内容列表
                     content_list = []
                     
@@ -274,60 +276,19 @@ async def process_douyin_url(event: AstrMessageEvent, douyin_ck: str = "") -> As
                         Comp.Plain(f"抖音 | {title}\n作者: {author}\n\n图集共 {len(images)} 张图片")
                     ])
                     
-                    # 下载图片
-                    downloaded_images = []
-                    try:
-                        async with aiohttp.ClientSession() as session:
-                            download_tasks = []
-                            for image_url in images:
-                                if image_url is not None:
-                                    download_tasks.append(download_image(image_url, session))
-                                    
-                            if download_tasks:
-                                downloaded_images = await asyncio.gather(*download_tasks)
-                    except Exception as e:
-                        logger.error(f"下载图片失败: {e}")
-                    
-                    # 添加每张图片到转发消息
-                    for i, image_path in enumerate(downloaded_images):
-                        if image_path is not None:
-                            content_list.append([
-                                Comp.Image.fromFileSystem(image_path),
-                                Comp.Plain(f"\n第 {i+1}/{len(downloaded_images)} 张")
-                            ])
+                    # 添加每张图片到转发消息，协议端可直接拉取链接，无需先下载到本地
+                    n = len(image_urls)
+                    content_list.extend([[Comp.Image.fromURL(image_url), Comp.Plain(f"\n第 {i+1}/{n} 张")]
+                                         for i, image_url in enumerate(image_urls)])
                     
                     # 发送合并转发消息
-                    if content_list:
-                        try:
-                            yield await send_forward_message(event, content_list)
-                        except Exception as e:
-                            logger.error(f"发送合并转发消息失败: {e}")
-                            # 失败后单独发送每张图片
-                            yield event.plain_result(f"合并转发失败，单独发送图片...")
-                            for i, image_path in enumerate(downloaded_images):
-                                if image_path is not None:
-                                    try:
-                                        yield event.chain_result([
-                                            Comp.Image.fromFileSystem(image_path),
-                                            Comp.Plain(f"\n第 {i+1}/{len(downloaded_images)} 张")
-                                        ])
-                                    except Exception as e2:
-                                        logger.error(f"发送单张图片失败: {e2}")
-                    
-                    # 清理临时文件
-                    for path in downloaded_images:
-                        if path and os.path.exists(path):
-                            try:
-                                os.remove(path)
-                            except Exception as e:
-                                logger.error(f"删除临时文件失败: {e}")
+                    yield await send_forward_message(event, content_list)
             else:
                 yield event.plain_result("抖音图集解析失败")
             return
 
         # 提取视频/笔记ID (如NoneBot示例)
-        reg2 = r".*(video|note)\/(\d+)\/?.*?"
-        id_match = re.search(reg2, dou_url_2, re.I)
+        id_match = _DY_ID.search(dou_url_2)
 
         if not id_match:
             yield event.plain_result("无法提取抖音视频/笔记ID")
@@ -346,86 +307,86 @@ async def process_douyin_url(event: AstrMessageEvent, douyin_ck: str = "") -> As
             'Accept-Language': 'zh-CN,zh;q=0.8,zh-TW;q=0.7,zh-HK;q=0.5,en-US;q=0.3,en;q=0.2',
             'referer': f'https://www.douyin.com/video/{douyin_id}',
             'cookie': douyin_ck,
-            'User-Agent': DOUYIN_HEADER['User-Agent']
+            'User-Agent': _UA
         }
 
         # 使用A-Bogus签名生成API URL (如NoneBot示例)
         api_url = DOUYIN_VIDEO_API.format(douyin_id)
-        api_url = generate_x_bogus_url(api_url, headers)
+        # 签名需要调用 JS，放到线程池中执行以免阻塞事件循环
+        api_url = await asyncio.get_running_loop().run_in_executor(None, generate_x_bogus_url, api_url, headers)
 
         # 请求API
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(api_url, headers=headers, timeout=10)
-            data = resp.json()
-
-            if not data or 'aweme_detail' not in data:
-                yield event.plain_result("抖音解析失败，无法获取内容详情")
-                return
+        resp = await get_http_client().get(api_url, headers=headers, timeout=10)
+        data = resp.json()
 
-            detail = data['aweme_detail']
-            desc = detail.get('desc', '无标题')
-            author = detail.get('author', { }).get('nickname', '未知作者')
-
-            # 判断内容类型 (类似NoneBot示例)
-            url_type_code = detail.get('aweme_type', 0)
-            url_type = URL_TYPE_CODE_DICT.get(url_type_code, 'video')
+        if not data or 'aweme_detail' not in data:
+            yield event.plain_result("抖音解析失败，无法获取内容详情")
+            return
 
-            if url_type == 'video':
-                # 处理视频 (类似NoneBot示例)
-                video_info = detail.get('video', { })
-                play_addr = video_info.get('play_addr', { })
-                uri = play_addr.get('uri')
+        detail = data['aweme_detail']
+        desc = detail.get('desc', '无标题')
+        author = detail.get('author', { }).get('nickname', '未知作者')
 
-                if not uri:
-                    yield event.plain_result("无法获取视频播放地址")
-                    return
+        # 判断内容类型 (类似NoneBot示例)
+        url_type_code = detail.get('aweme_type', 0)
+        url_type = URL_TYPE_CODE_DICT.get(url_type_code, 'video')
 
-                # 获取无水印视频地址
-                player_real_addr = DOUYIN_TOUTIAO_API.format(uri)
-                cover_url = video_info.get('cover', { }).get('url_list', [None])[0]
+        if url_type == 'video':
+            # 处理视频 (类似NoneBot示例)
+            video_info = detail.get('video', { })
+            play_addr = video_info.get('play_addr', { })
+            uri = play_addr.get('uri')
 
-                if cover_url is not None:
-                    yield event.chain_result([
-                        Comp.Image.fromURL(cover_url),
-                        Comp.Plain(f"识别：抖音\n作者：{author}\n标题：{desc}")
-                    ])
+            if not uri:
+                yield event.plain_result("无法获取视频播放地址")
+                return
 
-                # 直接通过URL发送视频，不需要下载
-                yield event.chain_result([Comp.Video.fromURL(player_real_addr)])
+            # 获取无水印视频地址
+            player_real_addr = DOUYIN_TOUTIAO_API.format(uri)
+            cover_url = video_info.get('cover', { }).get('url_list', [None])[0]
 
-            elif url_type == 'image':
-                # 发送基本信息
+            if cover_url is not None:
                 yield event.chain_result([
+                    Comp.Image.fromURL(cover_url),
                     Comp.Plain(f"识别：抖音\n作者：{author}\n标题：{desc}")
                 ])
 
-                # 处理图片集
-                images = detail.get('images', [])
-                
-                if not images:
-                    yield event.plain_result("无法获取图片内容")
-                    return
-                
-                # 创建消息内容列表
-                content_list = []
-                
-                # 添加介绍消息
-                content_list.append([
-                    Comp.Plain(f"抖音 | {desc}\n作者: {author}\n\n图集共 {len(images)} 张图片")
-                ])
-                
-                # 添加每张图片
-                for i, img in enumerate(images):
-                    url_list = img.get('url_list', [])
-                    if url_list and url_list[1] is not None:
-                        content_list.append([
-                            Comp.Image.fromURL(url_list[1]),
-                            Comp.Plain(f"\n第 {i+1}/{len(images)} 张")
-                        ])
-                
-                # 发送合并转发消息
-                if content_list:
-                    yield await send_forward_message(event, content_list)
+            # 直接通过URL发送视频，不需要下载
+            yield event.chain_result([Comp.Video.fromURL(player_real_addr)])
+
+        elif url_type == 'image':
+            # 发送基本信息
+            yield event.chain_result([
+                Comp.Plain(f"识别：抖音\n作者：{author}\n标题：{desc}")
+            ])
+
+            # 处理图片集
+            images = detail.get('images', [])
+            
+            if not images:
+                yield event.plain_result("无法获取图片内容")
+                return
+            
+            # 创建消息内容列表
+            content_list = []
+            
+            # 添加介绍消息
+            content_list.append([
+                Comp.Plain(f"抖音 | {desc}\n作者: {author}\n\n图集共 {len(images)} 张图片")
+            ])
+            
+            # 添加每张图片，协议端可直接拉取链接，无需先下载到本地
+            for i, img in enumerate(images):
+                url_list = img.get('url_list', [])
+                if len(url_list) > 1 and url_list[1] is not None:
+                    content_list.append([
+                        Comp.Image.fromURL(url_list[1]),
+                        Comp.Plain(f"\n第 {i+1}/{len(images)} 张")
+                    ])
+
+            # 发送合并转发消息
+            if content_list:
+                yield await send_forward_message(event, content_list)
 
     except Exception as e:
         logger.error(f"处理抖音链接失败: {e}")
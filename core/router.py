@@ -0,0 +1,121 @@
+"""
+判断消息中包含哪个平台的链接
+"""
+import re
+import threading
+from typing import Final, List, Optional, Tuple
+
+from astrbot.api import logger
+
+# 可选的 DFA 正则引擎，优先使用 hyperscan，其次 re2，都未安装时使用标准库 re
+try:
+    import hyperscan
+
+    HAS_HYPERSCAN = True
+except ImportError:
+    HAS_HYPERSCAN = False
+
+try:
+    import re2
+
+    HAS_RE2 = True
+except ImportError:
+    HAS_RE2 = False
+
+# 三个平台的链接合并为一个带命名分组的正则，一次扫描即可判断命中的平台。
+# BV 号两侧要求单词边界，不会把更长的字母数字串误认为 BV 号；
+# 边界只按 ASCII 字符判断（re2、hyperscan 默认如此），中文紧挨着 BV 号时仍能识别
+_LINK_PATTERN = (
+    r"(?P<bili>bilibili\.com|b23\.tv|bili2233\.cn|\bBV[1-9a-zA-Z]{10}\b)"
+    r"|(?P<douyin>v\.douyin\.com/)"
+    r"|(?P<xhs>(?:xhslink\.com|xiaohongshu\.com)/)"
+)
+LINK_RE = re2.compile(_LINK_PATTERN) if HAS_RE2 else re.compile(_LINK_PATTERN, re.ASCII)
+
+# 任何能被 LINK_RE 匹配的消息都至少包含其中一个子串
+LINK_NEEDLES: Final[Tuple[str, ...]] = ("bilibili", "b23.tv", "bili2233", "BV", "v.douyin.com", "xhslink.com", "xiaohongshu.com")
+
+# hyperscan 按 id 区分平台，与 LINK_RE 的分组一一对应
+_HS_KINDS: Final[Tuple[str, ...]] = ("bili", "douyin", "xhs")
+_HS_EXPRESSIONS: Final[Tuple[Tuple[bytes, int], ...]] = (
+    (rb"bilibili\.com", 0),
+    (rb"b23\.tv", 0),
+    (rb"bili2233\.cn", 0),
+    (rb"\bBV[1-9a-zA-Z]{10}\b", 0),
+    (rb"v\.douyin\.com/", 1),
+    (rb"xhslink\.com/", 2),
+    (rb"xiaohongshu\.com/", 2),
+)
+
+
+def _build_hyperscan_db():
+    """
+    编译 hyperscan 数据库，CPU 不支持等原因编译失败时返回 None，退回正则匹配
+
+    :return: hyperscan.Database 或 None
+    """
+    try:
+        db = hyperscan.Database()
+        db.compile(
+            expressions=[expression for expression, _ in _HS_EXPRESSIONS],
+            ids=[kind_id for _, kind_id in _HS_EXPRESSIONS],
+            elements=len(_HS_EXPRESSIONS),
+            # 需要知道匹配的起始位置，才能和 LINK_RE 一样取最先出现的链接
+            flags=[hyperscan.HS_FLAG_SOM_LEFTMOST] * len(_HS_EXPRESSIONS),
+        )
+        return db
+    except Exception as e:
+        logger.warning(f"hyperscan 数据库编译失败，使用正则匹配链接: {e}")
+        return None
+
+
+_HS_DB = _build_hyperscan_db() if HAS_HYPERSCAN else None
+# hyperscan 的 scratch 不能被多个线程同时使用，每个线程各自分配一份
+_HS_LOCAL = threading.local()
+
+
+def _classify_hyperscan(data: bytes) -> Optional[str]:
+    """
+    使用 hyperscan 判断消息中最先出现的平台链接
+
+    :param data: UTF-8 编码的消息
+    :return: 平台名称或 None
+    """
+    # hyperscan 按匹配结束位置回调，这里记录起始位置最小的一次匹配
+    first: List[int] = []
+
+    def on_match(kind_id: int, start: int, end: int, flags: int, context: object) -> None:
+        if not first or start < first[0]:
+            first[:] = [start, kind_id]
+
+    scratch = getattr(_HS_LOCAL, "scratch", None)
+    if scratch is None:
+        scratch = _HS_LOCAL.scratch = hyperscan.Scratch(_HS_DB)
+    _HS_DB.scan(data, match_event_handler=on_match, scratch=scratch)
+    return _HS_KINDS[first[1]] if first else None
+
+
+def has_link_needle(text: str) -> bool:
+    """
+    消息中是否包含任一平台链接的关键字，只做子串判断，不运行正则
+
+    :param text: 消息文本
+    :return: 是否可能包含链接
+    """
+    return any(needle in text for needle in LINK_NEEDLES)
+
+
+def classify(text: str) -> Optional[str]:
+    """
+    判断消息中最先出现的是哪个平台的链接
+
+    :param text: 消息文本
+    :return: "bili"、"douyin"、"xhs"，不含链接时返回 None
+    """
+    # 绝大多数消息不含任何链接，先用子串判断快速排除，包含关键字时才运行正则
+    if not has_link_needle(text):
+        return None
+    if _HS_DB is not None:
+        return _classify_hyperscan(text.encode())
+    m = LINK_RE.search(text)
+    return m.lastgroup if m else None
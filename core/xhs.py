@@ -1,11 +1,11 @@
 import re
 import os
 import json
-import httpx
 import asyncio
+import aiofiles
 import aiohttp
+import diskcache
 import time
-import random
 from typing import Any, Dict, List, AsyncGenerator, Optional
 from urllib.parse import urlparse, parse_qs
 
@@ -13,7 +13,16 @@ import astrbot.api.message_components as Comp
 from astrbot.api.event import AstrMessageEvent
 from astrbot.api import logger
 
-from .common import delete_boring_characters, remove_files, send_forward_message
+from .common import delete_boring_characters, remove_files, send_forward_message, get_http_client, \
+    download_all, SMALL_DOWNLOAD_LIMIT
+
+# INITIAL_STATE 通常有几百 KB，安装了 orjson 时用它解析，否则退回标准库
+try:
+    import orjson
+
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
 
 # Constants
 XHS_REQ_LINK = "https://www.xiaohongshu.com/explore/"
@@ -21,6 +30,14 @@ COMMON_HEADER = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
 }
 
+# 预编译的正则
+_XHS_URL = re.compile(r"(?:https?://)?(?:www\.)?(?:xhslink\.com|xiaohongshu\.com)/[A-Za-z\d._?%&+\-=/#@]+")
+# 三种笔记ID的位置合并为一个正则，一次扫描即可取出
+_XHS_ID = re.compile(r"/explore/(?P<a>\w+)|/discovery/item/(?P<b>\w+)|source=note&noteId=(?P<c>\w+)")
+# 页面状态直接在原始字节上匹配，省去整页解码
+_XHS_INITIAL = re.compile(rb'window.__INITIAL_STATE__=(.*?)</script>', re.S)
+_UNDEF_RE = re.compile(rb"\bundefined\b")
+
 # 数据目录和缓存目录
 DATA_DIR = os.path.join(os.getcwd(), "data")
 CACHE_DIR = os.path.join(DATA_DIR, "xhs_cache")
@@ -32,100 +49,78 @@ try:
 except Exception as e:
     logger.error(f"创建目录失败: {e}")
 
-async def download_img(url: str, path: str, session: Optional[aiohttp.ClientSession] = None) -> str:
+# 笔记数据缓存：带过期时间与容量上限的键值存储，替代每篇笔记一个 JSON 文件
+_XHS_CACHE = diskcache.Cache(os.path.join(CACHE_DIR, "notes"), size_limit=512 << 20)
+
+async def download_img(url: str, session: aiohttp.ClientSession) -> bytes:
     """
-    下载图片到指定路径
+    下载图片到内存，转发时直接使用字节内容，省去写入磁盘再读取、删除的过程
     
     :param url: 图片链接
-    :param path: 保存路径
-    :param session: 可选的 aiohttp 会话
-    :return: 保存的文件路径
+    :param session: 共用的 aiohttp 会话
+    :return: 图片的字节内容
     """
-    if session:
-        async with session.get(url) as response:
-            with open(path, 'wb') as fd:
-                async for chunk in response.content.iter_chunked(1024):
-                    fd.write(chunk)
-    else:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                with open(path, 'wb') as fd:
-                    async for chunk in response.content.iter_chunked(1024):
-                        fd.write(chunk)
-    return path
+    async with session.get(url) as response:
+        if response.content_length is not None and response.content_length < SMALL_DOWNLOAD_LIMIT:
+            return await response.read()
+        buf = bytearray()
+        async for chunk in response.content.iter_chunked(65536):
+            buf += chunk
+    return bytes(buf)
 
-async def download_video(url: str) -> str:
+async def download_video(url: str, session: aiohttp.ClientSession) -> str:
     """
     下载视频到缓存路径
     
     :param url: 视频链接
+    :param session: 共用的 aiohttp 会话
     :return: 保存的文件路径
     """
     # 确保缓存目录存在
     os.makedirs(CACHE_DIR, exist_ok=True)
     
-    # 生成唯一文件名
-    filename = f"xhs_video_{int(time.time())}_{random.randint(1000, 9999)}.mp4"
-    path = os.path.join(CACHE_DIR, filename)
-    
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as response:
-            with open(path, 'wb') as fd:
-                async for chunk in response.content.iter_chunked(1024):
-                    fd.write(chunk)
+    async with session.get(url) as response:
+        # 由 tempfile 生成唯一文件名，并发下载时不会互相覆盖
+        async with aiofiles.tempfile.NamedTemporaryFile('wb', dir=CACHE_DIR, prefix="xhs_video_", suffix=".mp4",
+                                                        delete=False) as fd:
+            path = fd.name
+            async for chunk in response.content.iter_chunked(65536):
+                await fd.write(chunk)
     return path
 
-def save_to_cache(note_id: str, data: Dict[str, Any]) -> None:
+def save_to_cache(note_id: str, data: Dict[str, Any], expire: int = 86400) -> None:
     """
     将小红书笔记数据保存到缓存
     
     :param note_id: 笔记ID
     :param data: 笔记数据
+    :param expire: 缓存有效期（秒），默认1天
     """
-    cache_path = os.path.join(CACHE_DIR, f"{note_id}.json")
     try:
-        # 确保目录存在
-        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
-        
-        # 添加缓存时间戳
-        cache_data = {
-            "timestamp": int(time.time()),
-            "data": data
-        }
-        
-        with open(cache_path, 'w', encoding='utf-8') as f:
-            json.dump(cache_data, f, ensure_ascii=False, indent=2)
-        
+        _XHS_CACHE.set(note_id, data, expire=expire)
         logger.info(f"小红书数据已缓存: {note_id}")
     except Exception as e:
         logger.error(f"保存小红书缓存失败: {e}")
 
-def get_from_cache(note_id: str, max_age: int = 86400) -> Optional[Dict[str, Any]]:
+def _match_xhs_id(url: str) -> Optional[str]:
+    """
+    从链接中提取小红书笔记ID
+
+    :param url: 小红书链接
+    :return: 笔记ID或None
+    """
+    m = _XHS_ID.search(url)
+    return m and (m.group('a') or m.group('b') or m.group('c'))
+
+def get_from_cache(note_id: str) -> Optional[Dict[str, Any]]:
     """
-    从缓存获取小红书笔记数据
+    从缓存获取小红书笔记数据，过期的数据由 diskcache 自动淘汰
     
     :param note_id: 笔记ID
-    :param max_age: 最大缓存时间（秒），默认1天
     :return: 笔记数据或None
     """
-    cache_path = os.path.join(CACHE_DIR, f"{note_id}.json")
-    
-    if not os.path.exists(cache_path):
-        return None
-    
     try:
-        with open(cache_path, 'r', encoding='utf-8') as f:
-            cache_data = json.load(f)
-        
-        # 检查缓存是否过期
-        timestamp = cache_data.get("timestamp", 0)
-        current_time = int(time.time())
-        
-        if current_time - timestamp > max_age:
-            logger.info(f"小红书缓存已过期: {note_id}")
-            return None
-        
-        return cache_data.get("data")
+        return _XHS_CACHE.get(note_id)
     except Exception as e:
         logger.error(f"读取小红书缓存失败: {e}")
         return None
@@ -205,11 +200,13 @@ def extract_note_info(note_data: Dict[str, Any]) -> Dict[str, Any]:
     
     return result
 
-async def process_xiaohongshu_url(event: AstrMessageEvent, xhs_ck: str) -> AsyncGenerator[Any, None]:
+async def process_xiaohongshu_url(event: AstrMessageEvent, session: aiohttp.ClientSession,
+                                  xhs_ck: str) -> AsyncGenerator[Any, None]:
     """
     处理小红书链接
     
     :param event: 消息事件
+    :param session: 插件共用的 aiohttp 会话
     :param xhs_ck: 小红书cookie
     :return: 异步生成结果
     """
@@ -219,7 +216,7 @@ async def process_xiaohongshu_url(event: AstrMessageEvent, xhs_ck: str) -> Async
     
     # 提取URL - 匹配形如 https://www.xiaohongshu.com/explore/6841430e000000002300f126 的链接
     message_str = event.message_str.strip()
-    msg_url_match = re.search(r"(https?:\/\/)?(?:www\.)?(xhslink\.com|xiaohongshu\.com)\/[A-Za-z\d._?%&+\-=\/#@]*", message_str)
+    msg_url_match = _XHS_URL.search(message_str)
     
     if not msg_url_match:
         return
@@ -233,31 +230,31 @@ async def process_xiaohongshu_url(event: AstrMessageEvent, xhs_ck: str) -> Async
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
     }
     
-    # 如果是短链接，获取完整链接
-    if "xhslink" in msg_url:
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(msg_url, headers=headers, follow_redirects=True)
-                msg_url = str(response.url)
-        except Exception as e:
-            yield event.plain_result(f"解析小红书链接失败: {str(e)}")
-            return
+    # 如果是短链接，获取完整链接；解析过的短链接记录在缓存中，重复分享时不必再请求一次重定向
+    if "xhslink" in msg_url and not _match_xhs_id(msg_url):
+        short_key = f"xhslink:{msg_url}"
+        resolved_url = await asyncio.to_thread(get_from_cache, short_key)
+        if not resolved_url:
+            try:
+                response = await get_http_client().get(msg_url, headers=headers, follow_redirects=True)
+                resolved_url = str(response.url)
+            except Exception as e:
+                yield event.plain_result(f"解析小红书链接失败: {str(e)}")
+                return
+            # 只缓存能提取出笔记ID的链接，重定向到验证码、登录页时不缓存，下次重新解析
+            if _match_xhs_id(resolved_url):
+                await asyncio.to_thread(save_to_cache, short_key, resolved_url)
+        msg_url = resolved_url
     
     # 提取小红书ID
-    xhs_id_match = re.search(r'/explore/(\w+)', msg_url)
-    if not xhs_id_match:
-        xhs_id_match = re.search(r'/discovery/item/(\w+)', msg_url)
-    if not xhs_id_match:
-        xhs_id_match = re.search(r'source=note&noteId=(\w+)', msg_url)
+    xhs_id = _match_xhs_id(msg_url)
     
-    if not xhs_id_match:
+    if not xhs_id:
         yield event.plain_result(f"无法从链接中提取小红书ID")
         return
     
-    xhs_id = xhs_id_match.group(1)
-    
     # 首先尝试从缓存获取数据
-    cached_data = get_from_cache(xhs_id)
+    cached_data = await asyncio.to_thread(get_from_cache, xhs_id)
     note_data = None
     
     if cached_data:
@@ -274,31 +271,31 @@ async def process_xiaohongshu_url(event: AstrMessageEvent, xhs_ck: str) -> Async
         
         # 请求小红书内容
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f'{XHS_REQ_LINK}{xhs_id}?xsec_source={xsec_source}&xsec_token={xsec_token}', 
-                    headers=headers
-                )
-                html = response.text
+            response = await get_http_client().get(
+                f'{XHS_REQ_LINK}{xhs_id}?xsec_source={xsec_source}&xsec_token={xsec_token}',
+                headers=headers
+            )
+            html = response.content
         except Exception as e:
             yield event.plain_result(f"请求小红书内容失败: {str(e)}")
             return
         
         # 解析JSON数据
         try:
-            response_json_match = re.search('window.__INITIAL_STATE__=(.*?)</script>', html)
+            response_json_match = _XHS_INITIAL.search(html)
             if not response_json_match:
                 yield event.plain_result("无法解析小红书内容，Cookie可能已失效")
                 return
                 
-            response_json_str = response_json_match.group(1).replace("undefined", "null")
-            response_json = json.loads(response_json_str)
+            # JS 中的 undefined 不是合法的 JSON，替换为 null
+            response_json_str = _UNDEF_RE.sub(b"null", response_json_match.group(1))
+            response_json = _json_loads(response_json_str)
             
             raw_note_data = response_json['note']['noteDetailMap'][xhs_id]['note']
             
             # 提取并缓存数据
             note_data = extract_note_info(raw_note_data)
-            save_to_cache(xhs_id, note_data)
+            await asyncio.to_thread(save_to_cache, xhs_id, note_data)
             
         except Exception as e:
             yield event.plain_result(f"解析小红书内容失败: {str(e)}")
@@ -328,10 +325,13 @@ async def process_xiaohongshu_url(event: AstrMessageEvent, xhs_ck: str) -> Async
     stats = note_data.get('stats', {})
     liked_icon = "❤️" if stats.get('liked', False) else "👍"
     collected_icon = "⭐" if stats.get('collected', False) else "⭐"
+    # 统计和时间文本在回复和转发消息中都会用到，只构建一次
+    stats_text = f"{liked_icon} {stats.get('like_count', 0)} | 💬 {stats.get('comment_count', 0)} | {collected_icon} {stats.get('collect_count', 0)}"
     
-    reply_text += f"\n{liked_icon} {stats.get('like_count', 0)} | 💬 {stats.get('comment_count', 0)} | {collected_icon} {stats.get('collect_count', 0)}"
+    reply_text += f"\n{stats_text}"
     
-    if 'time' in note_data and note_data['time']:
+    time_str = ""
+    if note_data.get('time'):
         # 转换时间戳为可读时间
         time_str = time.strftime("%Y-%m-%d %H:%M", time.localtime(note_data['time']/1000))
         reply_text += f"\n发布时间: {time_str}"
@@ -347,25 +347,15 @@ async def process_xiaohongshu_url(event: AstrMessageEvent, xhs_ck: str) -> Async
             yield event.plain_result("未找到图片内容")
             return
         
-        # 创建临时目录
-        os.makedirs(CACHE_DIR, exist_ok=True)
-        
         # 下载图片
-        image_paths = []
-        async with aiohttp.ClientSession() as session:
-            download_tasks = []
-            for index, item in enumerate(image_list):
-                image_url = item.get('url', '')
-                if not image_url:
-                    continue
-                path = os.path.join(CACHE_DIR, f"xhs_{xhs_id}_{index}.jpg")
-                download_tasks.append(asyncio.create_task(
-                    download_img(image_url, path, session=session)))
-            
-            if download_tasks:
-                image_paths = await asyncio.gather(*download_tasks)
+        image_contents = []
+        image_urls = [item['url'] for item in image_list if item.get('url')]
+        if image_urls:
+            results = await download_all(image_urls, lambda image_url: download_img(image_url, session=session))
+            # 只保留下载成功的图片，部分失败时仍然发送其余图片
+            image_contents = [content for content in results if content]
         
-        if not image_paths:
+        if not image_contents:
             yield event.plain_result("图片下载失败")
             return
         
@@ -390,29 +380,23 @@ async def process_xiaohongshu_url(event: AstrMessageEvent, xhs_ck: str) -> Async
             
         # 添加统计信息
         content_list.append([
-            Comp.Plain(f"{liked_icon} {stats.get('like_count', 0)} | 💬 {stats.get('comment_count', 0)} | {collected_icon} {stats.get('collect_count', 0)}")
+            Comp.Plain(stats_text)
         ])
         
         # 添加时间信息
-        if 'time' in note_data and note_data['time']:
-            time_str = time.strftime("%Y-%m-%d %H:%M", time.localtime(note_data['time']/1000))
+        if time_str:
             content_list.append([
                 Comp.Plain(f"发布时间: {time_str}")
             ])
         
         # 添加图片
-        for i, path in enumerate(image_paths):
-            content_list.append([
-                Comp.Plain(f"第 {i+1}/{len(image_paths)} 张"),
-                Comp.Image.fromFileSystem(path)
-            ])
+        n = len(image_contents)
+        content_list.extend([[Comp.Plain(f"第 {i+1}/{n} 张"), Comp.Image.fromBytes(content)]
+                             for i, content in enumerate(image_contents)])
         
         # 发送合并转发消息
         yield await send_forward_message(event, content_list)
         
-        # 清理临时文件
-        remove_files(image_paths)
-        
     elif content_type == 'video':
         # 视频帖子
         video_info = note_data.get('video', {})
@@ -424,7 +408,7 @@ async def process_xiaohongshu_url(event: AstrMessageEvent, xhs_ck: str) -> Async
         
         # 下载视频
         try:
-            video_path = await download_video(video_url)
+            video_path = await download_video(video_url, session)
             
             # 发送视频
             yield event.chain_result([
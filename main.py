@@ -1,50 +1,79 @@
+import weakref
+from functools import cached_property
+
 from astrbot.api import AstrBotConfig
 from astrbot.api.event import filter, AstrMessageEvent
 from astrbot.api.star import Context, Star, register
 from bilibili_api import Credential
-from typing import Any, AsyncGenerator
+from typing import Any, AsyncGenerator, Optional
 
 from .core.bili23 import process_bilibili_url
+from .core.common import close_sessions, coalesce_results, get_session
 from .core.douyin import process_douyin_url
+from .core.router import classify
 from .core.xhs import process_xiaohongshu_url
 
+# 过滤器判断出的平台按事件记录，处理函数直接读取，不再扫描第二遍。
+# 不能用 event.set_extra：waking_check 阶段在每个处理函数的过滤器执行后会清空 extras
+_LINK_KINDS: "weakref.WeakKeyDictionary[AstrMessageEvent, str]" = weakref.WeakKeyDictionary()
+
+
+class LinkFilter(filter.CustomFilter):
+    """
+    消息中包含B站、抖音或小红书链接时才激活处理函数。
+    框架自带的 regex 过滤器使用 match，正则必须以 .* 开头，这里改用合并后的预编译正则一次 search 判断三个平台
+    """
+
+    def filter(self, event: AstrMessageEvent, cfg: AstrBotConfig) -> bool:
+        # 长消息也做完整识别：只做子串预筛时，提到 "bilibili"、"BV" 的长消息会误激活处理函数
+        kind = classify(event.get_message_str())
+        if kind is None:
+            return False
+        _LINK_KINDS[event] = kind
+        return True
+
 
 @register("R插件", "RrOrange", "专门为朋友们写的AstrBot插件，专注图片视频分享、生活、健康和学习的插件！", "1.0.0")
 class RPlugin(Star):
+    # 配置项在初始化后不再变化，放在 slots 中，处理消息时读取不经过实例 __dict__
+    # credential 是 cached_property，需要存放在实例 __dict__ 中，不能出现在 slots 里
+    __slots__ = ("config", "VIDEO_DURATION_MAXIMUM", "DOUYIN_CK", "XHS_CK")
+
     def __init__(self, context: Context, config: AstrBotConfig):
         super().__init__(context)
-        self.config = config
-        self.credential = Credential(sessdata=self.config["BILI_SESSDATA"])
-        self.VIDEO_DURATION_MAXIMUM = self.config["VIDEO_DURATION_MAXIMUM"]
-        self.DOUYIN_CK = self.config.get("DOUYIN_CK", "")
-        self.XHS_CK = self.config.get("XHS_CK", "")
+        self.config: AstrBotConfig = config
+        self.VIDEO_DURATION_MAXIMUM: int = self.config["VIDEO_DURATION_MAXIMUM"]
+        self.DOUYIN_CK: str = self.config.get("DOUYIN_CK", "")
+        self.XHS_CK: str = self.config.get("XHS_CK", "")
 
     async def initialize(self):
         """可选择实现异步的插件初始化方法，当实例化该插件类之后会自动调用该方法。"""
 
-    @filter.regex(r".*(bilibili\.com|b23\.tv|bili2233\.cn|BV[1-9a-zA-Z]{10}).*")
-    async def bilibili(self, event: AstrMessageEvent):
+    @cached_property
+    def credential(self) -> Credential:
         """
-        处理B站链接，业务逻辑已移至 core/bili23.py
+        B站登录凭据，收到第一条B站链接时才创建
         """
-        async for result in process_bilibili_url(event, self.credential, self.VIDEO_DURATION_MAXIMUM):
-            yield result
+        return Credential(sessdata=self.config["BILI_SESSDATA"])
 
-    @filter.regex(r".*v\.douyin\.com\/[A-Za-z\d._?%&+\-=#]*.*")
-    async def douyin(self, event: AstrMessageEvent):
-        """
-        处理抖音链接，业务逻辑已移至 core/douyin.py
-        """
-        async for result in process_douyin_url(event, self.DOUYIN_CK):
-            yield result
-            
-    @filter.regex(r".*(https?:\/\/)?(?:www\.)?(xhslink\.com|xiaohongshu\.com)\/[A-Za-z\d._?%&+\-=\/#@]*.*")
-    async def xiaohongshu(self, event: AstrMessageEvent):
+    @filter.custom_filter(LinkFilter)
+    def parse_link(self, event: AstrMessageEvent) -> Optional[AsyncGenerator[Any, None]]:
         """
-        处理小红书链接，业务逻辑已移至 core/xhs.py
+        处理B站、抖音、小红书链接，业务逻辑分别在 core/bili23.py、core/douyin.py、core/xhs.py
         """
-        async for result in process_xiaohongshu_url(event, self.XHS_CK):
-            yield result
+        kind = _LINK_KINDS.pop(event, None) or classify(event.message_str)
+        if kind == "bili":
+            results = process_bilibili_url(event, self.credential, self.VIDEO_DURATION_MAXIMUM)
+        elif kind == "douyin":
+            results = process_douyin_url(event, self.DOUYIN_CK)
+        elif kind == "xhs":
+            results = process_xiaohongshu_url(event, get_session(), self.XHS_CK)
+        else:
+            return None
+        # 连续产出的文本和图片合并为一条消息发送。
+        # 直接返回生成器，由框架迭代，每条结果只经过一层生成器；结束或被关闭时 coalesce_results 会关闭 results
+        return coalesce_results(results)
 
     async def terminate(self):
         """可选择实现异步的插件销毁方法，当插件被卸载/停用时会调用。"""
+        await close_sessions()